@@ -1,4 +1,5 @@
 import os
+import numpy as np
 import pandas as pd
 
 from utils import read_table
@@ -11,72 +12,112 @@ def load_report(report_path: str):
     return read_table(report_path)
 
 
-def q1_total_interactions_by_center(report: pd.DataFrame):
+def summarize_report(report: pd.DataFrame):
+    """
+    Sum the report metrics by month and contact center in one pass. The questions below are all answered from this
+    cube instead of re-grouping the full report for each one. Rows with no month or no contact center are kept, each
+    question decides what to do with them
+    """
+    cube = report.groupby(["month", "contact_center_name"], dropna=False).agg(
+        total_interactions=("total_interactions", "sum"),
+        total_calls=("total_calls", "sum"),
+        total_call_duration=("total_call_duration", "sum")
+    )
+
+    return cube
+
+
+def drop_missing_centers(cube: pd.DataFrame):
+    """
+    Drop cube rows with no contact center name, which the per-center questions don't report on
+    """
+    return cube[cube.index.get_level_values("contact_center_name").notna()]
+
+
+def q1_total_interactions_by_center(cube: pd.DataFrame):
     """
     What were the total number of interactions handled by each contact center in Q1 2025?
-    Group report by contact center, sum total interactions
+    Roll the cube up to contact center, sum total interactions
     """
     result = (
-        report.groupby("contact_center_name")["total_interactions"]
+        drop_missing_centers(cube).groupby(level="contact_center_name")["total_interactions"]
         .sum()
         .reset_index()
     )
     return result
 
 
-def q2_month_highest_interactions(report: pd.DataFrame):
+def q2_month_highest_interactions(cube: pd.DataFrame):
     """
     Which month (Jan, Feb, or Mar) had the highest total interaction volume?
-    Group by month and sum the total interactions. Sort highest->lowest and report first result
+    Roll the cube up to month and sum the total interactions. Report the month with the highest total
     """
-    result = (
-        report.groupby("month")["total_interactions"]
-        .sum()
-        .reset_index()
-        .sort_values("total_interactions", ascending=False)
-        .head(1)
-    )
+    # interactions with no month can't be credited to one, so they're left out here
+    totals = cube.groupby(level="month", dropna=True)["total_interactions"].sum()
+
+    # idxmax has nothing to pick from on an empty report
+    if totals.empty:
+        return totals.reset_index()
+
+    result = totals.loc[[totals.idxmax()]].reset_index()
 
     return result
 
 
-def q3_longest_avg_call(report: pd.DataFrame):
+def q3_longest_avg_call(cube: pd.DataFrame):
     """
     Which contact center had the longest average phone call duration (total_call_duration)?
         Why might this be the case based on the interactions data?
         What approach would you recommend to measure agent work time more accurately?
 
-    Group all calls by contact center name, calculate the average call duration, and report the highest value
+    Roll the cube up to contact center, calculate the average call duration, and report the highest value
     """
-    report = report.copy()
-    report = report.groupby(
-        "contact_center_name"
-    ).agg(
-        total_call_duration=("total_call_duration", "sum"),
-        total_calls=("total_calls", "sum")
+    cube = drop_missing_centers(cube)
+
+    # the cube index already holds factorized center codes, so one weighted bincount per metric sums every center
+    level = cube.index.names.index("contact_center_name")
+    codes = cube.index.codes[level]
+    centers = cube.index.levels[level]
+
+    total_call_duration = np.bincount(
+        codes, weights=cube["total_call_duration"].to_numpy(dtype="float64"), minlength=len(centers)
+    )
+    total_calls = np.bincount(
+        codes, weights=cube["total_calls"].to_numpy(dtype="float64"), minlength=len(centers)
     )
 
-    report["avg_call_duration"] = report["total_call_duration"] / report["total_calls"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_call_duration = total_call_duration / total_calls
 
-    result = (
-        report.sort_values("avg_call_duration", ascending=False).head(1)
+    result = pd.DataFrame(
+        {
+            "total_call_duration": total_call_duration,
+            "total_calls": total_calls.astype("int64"),
+            "avg_call_duration": avg_call_duration,
+        },
+        index=pd.Index(centers, name="contact_center_name"),
     )
 
-    return result
+    # no center took a phone call (or the report is empty), so there is no average to rank
+    if np.isnan(avg_call_duration).all():
+        return result.iloc[:0]
+
+    return result.iloc[[np.nanargmax(avg_call_duration)]]
 
 
 def run_answers(report_path: str):
     """Run all business questions and print answers."""
     report = load_report(report_path)
+    cube = summarize_report(report)
 
     print("\nQ1: Total number of interactions handled by each contact center in Q1 2025")
-    print(q1_total_interactions_by_center(report))
+    print(q1_total_interactions_by_center(cube))
 
     print("\nQ2: Which month had the highest total interaction volume?")
-    print(q2_month_highest_interactions(report))
+    print(q2_month_highest_interactions(cube))
 
     print("\nQ3: Which contact center had the longest average phone call duration?")
-    print(q3_longest_avg_call(report))
+    print(q3_longest_avg_call(cube))
 
     print("\nDiscussion:")
     print("- The Boston MA contact center has a number of outliers on the high end of call duration.")
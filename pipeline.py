@@ -1,16 +1,46 @@
 import argparse
 import glob
 import os
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+import pyarrow as pa
+from pandas.api.types import is_datetime64_any_dtype
 
+from report import build_report
 from utils import (
     make_output_dir,
     get_month_from_filename,
     read_table,
     write_table,
-    apply_delta
+    apply_delta,
+    share_categories,
+    validate_id_columns
 )
 
+# Known column types per table, passed to the CSV reader so ID columns aren't re-inferred on every initial/delta file
+TABLE_SCHEMAS = {
+    "agents": {
+        "agent_id": pa.string(),
+        "contact_center_id": pa.string(),
+        "category_id": pa.string(),
+    },
+    "contact_centers": {
+        "contact_center_id": pa.string(),
+    },
+    "service_categories": {
+        "category_id": pa.string(),
+    },
+    "interactions": {
+        "interaction_id": pa.string(),
+        "agent_id": pa.string(),
+        "contact_center_id": pa.string(),
+        "category_id": pa.string(),
+    },
+}
+
+# Interactions columns stored as UTC timestamps, converted to Eastern before the final tables are written
+TIMESTAMP_COLUMNS = ("timestamp", "interaction_start", "agent_resolution_timestamp", "interaction_end")
+
 
 def list_initial_files(data_dir: str):
     """
@@ -51,22 +81,26 @@ def list_delta_files(data_dir: str):
 
 def convert_utc_to_est(ts_series: pd.Series):
     """
-    Converts datetime series from UTC to EST
+    Converts datetime series from UTC to EST. Columns the CSV reader already inferred as tz-aware timestamps are only
+    converted, naive timestamps and strings are parsed as UTC once with the ISO8601 fast path
     """
-    return pd.to_datetime(ts_series, utc=True).dt.tz_convert("US/Eastern")
+    if is_datetime64_any_dtype(ts_series.dtype) and ts_series.dt.tz is not None:
+        return ts_series.dt.tz_convert("US/Eastern")
+
+    return pd.to_datetime(ts_series, utc=True, format="ISO8601", cache=True).dt.tz_convert("US/Eastern")
 
 
 def handle_missing(interactions, agents, contact_centers, service_categories):
     """
     Ensures that deleted ID fields are replaced with "Unknown" in the final Interactions file.
     """
-    final_agents = set(agents["agent_id"].unique())
-    final_contact_centers = set(contact_centers["contact_center_id"].unique())
-    final_service_categories = set(service_categories["category_id"].unique())
+    valid_agent = interactions["agent_id"].isin(agents["agent_id"].array)
+    valid_contact_center = interactions["contact_center_id"].isin(contact_centers["contact_center_id"].array)
+    valid_category = interactions["category_id"].isin(service_categories["category_id"].array)
 
-    interactions.loc[~interactions["agent_id"].isin(final_agents), "agent_id"] = "Unknown"
-    interactions.loc[~interactions["contact_center_id"].isin(final_contact_centers), "contact_center_id"] = "Unknown"
-    interactions.loc[~interactions["category_id"].isin(final_service_categories), "category_id"] = "Unknown"
+    interactions["agent_id"] = interactions["agent_id"].where(valid_agent, "Unknown")
+    interactions["contact_center_id"] = interactions["contact_center_id"].where(valid_contact_center, "Unknown")
+    interactions["category_id"] = interactions["category_id"].where(valid_category, "Unknown")
 
     return interactions
 
@@ -84,21 +118,18 @@ def process(args):
 
     initial_files = list_initial_files(args.data_dir)
 
-    agents = read_table(initial_files["agents"])
-    contact_centers = read_table(initial_files["contact_centers"])
-    service_categories = read_table(initial_files["service_categories"])
-    interactions = read_table(initial_files["interactions"])
-
-    required_id_columns = [
-        (agents, "agents", "agent_id"),
-        (contact_centers, "contact_centers", "contact_center_id"),
-        (service_categories, "service_categories", "category_id"),
-        (interactions, "interactions", "interaction_id")
-    ]
+    agents = read_table(initial_files["agents"], schema=TABLE_SCHEMAS["agents"])
+    contact_centers = read_table(initial_files["contact_centers"], schema=TABLE_SCHEMAS["contact_centers"])
+    service_categories = read_table(initial_files["service_categories"], schema=TABLE_SCHEMAS["service_categories"])
+    interactions = read_table(initial_files["interactions"], schema=TABLE_SCHEMAS["interactions"])
 
-    for df, name, id_col in required_id_columns:
-        if id_col not in df.columns:
-            raise ValueError(f"{name} table is missing the required ID column '{id_col}'")
+    # The base tables are checked once here, apply_delta only has to check each delta file
+    validate_id_columns({
+        "agents": (agents, "agent_id"),
+        "contact_centers": (contact_centers, "contact_center_id"),
+        "service_categories": (service_categories, "category_id"),
+        "interactions": (interactions, "interaction_id"),
+    })
 
     # -------------------------------------------
     # STEP 2: APPLY DELTAS AND HANDLE MISSING IDs
@@ -113,39 +144,55 @@ def process(args):
         if cleaned:
             months_filter.add(cleaned)
 
+    delta_dir = os.path.join(args.data_dir, "delta")
+
     def iterate_deltas(table_type: str):
         """
-        Filters for delta files based on the provided YYYYMM codes
+        Filters for delta files based on the provided YYYYMM codes. When months are given, only those months are
+        globbed, so the filenames never have to be parsed
         """
+        if not months_filter:
+            return [(get_month_from_filename(file_path), file_path) for file_path in delta_files[table_type]]
+
         result = []
 
-        files = delta_files[table_type]
-        for file_path in files:
-            month_code = get_month_from_filename(file_path)
+        for month_code in sorted(months_filter):
+            # escaped so a --months value like "*" or "2025?" can only match its literal filename
+            month_glob = glob.escape(month_code)
+            for pattern in (f"{table_type}_{month_glob}.csv", f"{table_type}_*_{month_glob}.csv"):
+                for file_path in sorted(glob.glob(os.path.join(glob.escape(delta_dir), pattern))):
+                    result.append((month_code, file_path))
 
-            if months_filter and month_code not in months_filter:
-                continue
+        return result
 
-            result.append((month_code, file_path))
+    # Delta files are independent of each other, so every selected file is read up front on a thread pool. The
+    # futures are kept in month order per table, since the actions still have to be applied one month at a time
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        delta_reads = {
+            table_type: [
+                executor.submit(read_table, path, schema=TABLE_SCHEMAS[table_type])
+                for month, path in iterate_deltas(table_type)
+            ]
+            for table_type in TABLE_SCHEMAS
+        }
 
-        return result
+    # Applying the add/update/delete actions to the initial file
+    for delta_read in delta_reads["agents"]:
+        agents = apply_delta(agents, delta_read.result(), "agent_id")
 
-    # Grabbing selected delta files and applying the add/update/delete actions to the initial file
-    for month, path in iterate_deltas("agents"):
-        delta_data = read_table(path)
-        agents = apply_delta(agents, delta_data, "agent_id")
+    for delta_read in delta_reads["contact_centers"]:
+        contact_centers = apply_delta(contact_centers, delta_read.result(), "contact_center_id")
 
-    for month, path in iterate_deltas("contact_centers"):
-        delta_data = read_table(path)
-        contact_centers = apply_delta(contact_centers, delta_data, "contact_center_id")
+    for delta_read in delta_reads["service_categories"]:
+        service_categories = apply_delta(service_categories, delta_read.result(), "category_id")
 
-    for month, path in iterate_deltas("service_categories"):
-        delta_data = read_table(path)
-        service_categories = apply_delta(service_categories, delta_data, "category_id")
+    for delta_read in delta_reads["interactions"]:
+        interactions = apply_delta(interactions, delta_read.result(), "interaction_id")
 
-    for month, path in iterate_deltas("interactions"):
-        delta_data = read_table(path)
-        interactions = apply_delta(interactions, delta_data, "interaction_id")
+    # Put the reference ID columns on shared categorical dtypes so the lookups below compare codes, not strings
+    share_categories([agents, interactions], "agent_id")
+    share_categories([contact_centers, interactions], "contact_center_id")
+    share_categories([service_categories, interactions], "category_id")
 
     # Fixes deleted IDs if they were deleted in a delta file
     interactions = handle_missing(interactions, agents, contact_centers, service_categories)
@@ -154,27 +201,12 @@ def process(args):
     # STEP 3: CONVERT TIMESTAMPS
     # ---------------------------
 
-    if "timestamp" in interactions.columns:
-        try:
-            interactions["timestamp"] = convert_utc_to_est(interactions["timestamp"])
-        except Exception as e:
-            print(f"Could not convert timestamps: {e}")
+    for col in TIMESTAMP_COLUMNS:
+        if col not in interactions.columns:
+            continue
 
-    if "interaction_start" in interactions.columns:
         try:
-            interactions["interaction_start"] = convert_utc_to_est(interactions["interaction_start"])
-        except Exception as e:
-            print(f"Could not convert timestamps: {e}")
-
-    if "agent_resolution_timestamp" in interactions.columns:
-        try:
-            interactions["agent_resolution_timestamp"] = convert_utc_to_est(interactions["agent_resolution_timestamp"])
-        except Exception as e:
-            print(f"Could not convert timestamps: {e}")
-
-    if "interaction_end" in interactions.columns:
-        try:
-            interactions["interaction_end"] = convert_utc_to_est(interactions["interaction_end"])
+            interactions[col] = convert_utc_to_est(interactions[col])
         except Exception as e:
             print(f"Could not convert timestamps: {e}")
 
@@ -193,14 +225,26 @@ def process(args):
     save_table(service_categories, "service_categories")
     save_table(interactions, "interactions")
 
+    return {
+        "agents": agents,
+        "contact_centers": contact_centers,
+        "service_categories": service_categories,
+        "interactions": interactions,
+    }
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run the data pipeline.")
     parser.add_argument("--data-dir", default="./data", help="Path to folder containing initial/ and delta/")
     parser.add_argument("--out-dir", default="./output", help="Path to write outputs to.")
-    parser.add_argument("--format", default="csv", choices=["csv", "json", "parquet"],
+    parser.add_argument("--format", default="parquet", choices=["csv", "json", "parquet"],
                         help="Output format. Can be 'csv', 'json', or 'parquet'.")
     parser.add_argument("--months", default="202502, 202503", help="Optional months to process, e.g. 202502, 202503")
+    parser.add_argument("--report-dir", default=None,
+                        help="Optional. Also build the support report from the in-memory final tables and write it here.")
     args = parser.parse_args()
 
-    process(args)
+    final_tables = process(args)
+
+    if args.report_dir:
+        build_report(out_dir=args.report_dir, tables=final_tables)
@@ -1,48 +1,89 @@
 import os
+import numpy as np
 import pandas as pd
 
 from utils import read_table, write_table, make_output_dir
 
+# Interactions columns the report reads from the final table
+REPORT_COLUMNS = [
+    "interaction_id",
+    "channel",
+    "category_id",
+    "contact_center_id",
+    "interaction_end",
+    "call_duration_minutes",
+]
 
-def build_report(data_dir: str, out_dir: str, fmt: str = "csv"):
+
+def build_report(data_dir: str = "./output", out_dir: str = "./report", fmt: str = "csv", data_fmt: str = "parquet",
+                 tables: dict = None):
     make_output_dir(out_dir)
 
-    # Load final tables
-    contact_centers = read_table(os.path.join(data_dir, f"contact_centers_final.{fmt}"))
-    service_categories = read_table(os.path.join(data_dir, f"service_categories_final.{fmt}"))
-    interactions = read_table(os.path.join(data_dir, f"interactions_final.{fmt}"))
+    try:
+        if tables is not None:
+            # Final tables handed over in-process by the pipeline, no disk round-trip
+            contact_centers = tables["contact_centers"][["contact_center_id", "contact_center_name"]].copy()
+            service_categories = tables["service_categories"][["category_id", "department"]].copy()
+            interactions = tables["interactions"][REPORT_COLUMNS].copy()
+        else:
+            # Load final tables, written by the pipeline as parquet unless it was run with a different --format. Only
+            # the columns the report uses are read, the rest are never parsed or materialized
+            contact_centers = read_table(
+                os.path.join(data_dir, f"contact_centers_final.{data_fmt}"),
+                columns=["contact_center_id", "contact_center_name"]
+            )
+            service_categories = read_table(
+                os.path.join(data_dir, f"service_categories_final.{data_fmt}"),
+                columns=["category_id", "department"]
+            )
+            interactions = read_table(
+                os.path.join(data_dir, f"interactions_final.{data_fmt}"),
+                columns=REPORT_COLUMNS
+            )
+    except KeyError as e:
+        raise ValueError(f"Final tables are missing a column the report needs: {e}") from e
 
-    if "interaction_end" not in interactions.columns:
-        raise ValueError("Interactions table must include an 'interaction_end' column.")
+    # the CSV reader normalizes offsets to UTC, so shift back to Eastern before bucketing by month
+    interaction_end = pd.to_datetime(interactions["interaction_end"], utc=True).dt.tz_convert("US/Eastern")
 
-    # extract month from interaction date, pandas doesn't like datetimes with tz info, so I do this manually
-    interactions["month"] = interactions["interaction_end"].astype(str).str[:7]
+    # month key as a YYYYMM integer, only the grouped output gets formatted back to "YYYY-MM"
+    interactions["month"] = (
+        interaction_end.dt.year.astype("Int32") * 100 + interaction_end.dt.month.astype("Int32")
+    )
 
-    # determine phone calls, set calls to value 1, others to 0
-    interactions["is_call"] = interactions["channel"].str.lower().eq("phone").astype(int)
+    # determine phone calls, set calls to value 1, others to 0. Only the handful of distinct channels get lower-cased,
+    # rows are matched on their factorized codes
+    channel_codes, channels = pd.factorize(interactions["channel"])
+    phone_codes = np.flatnonzero(pd.Index(channels).str.lower() == "phone")
+    interactions["is_call"] = np.isin(channel_codes, phone_codes).astype("int8")
 
-    # adding dimensions to interactions
-    interactions = interactions.merge(
-        contact_centers[["contact_center_id", "contact_center_name"]],
-        on="contact_center_id",
-        how="left"
-    )
+    # adding dimensions to interactions. Both dimension tables are tiny, so their attributes are attached with an
+    # indexed lookup instead of a merge that rebuilds the whole interactions frame
+    center_names = contact_centers.drop_duplicates("contact_center_id", keep="last").set_index(
+        "contact_center_id"
+    )["contact_center_name"]
+    departments = service_categories.drop_duplicates("category_id", keep="last").set_index(
+        "category_id"
+    )["department"]
 
-    interactions = interactions.merge(
-        service_categories[["category_id", "department"]],
-        on="category_id",
-        how="left"
-    )
+    interactions["contact_center_name"] = interactions["contact_center_id"].map(center_names)
+    interactions["department"] = interactions["category_id"].map(departments)
+
+    # categorical keys let the groupby hash small integer codes instead of strings
+    for col in ("month", "contact_center_name", "department"):
+        interactions[col] = interactions[col].astype("category")
 
     # group by month, concat center name, and department, calculate metrics
     grouped = interactions.groupby(
-        ["month", "contact_center_name", "department"], dropna=False
+        ["month", "contact_center_name", "department"], dropna=False, observed=True
     ).agg(
         total_interactions=("interaction_id", "count"),
         total_calls=("is_call", "sum"),
         total_call_duration=("call_duration_minutes", "sum")
     ).reset_index()
 
+    grouped["month"] = grouped["month"].map(lambda m: f"{m // 100}-{m % 100:02d}", na_action="ignore")
+
     # write report, defaulting table to export as .csv to
     report_path = os.path.join(out_dir, f"support_report.{fmt}")
     write_table(grouped, report_path, fmt=fmt)
@@ -53,4 +94,4 @@ def build_report(data_dir: str, out_dir: str, fmt: str = "csv"):
 # relative paths of final pipeline output and path to write report just hard-coded
 
 if __name__ == "__main__":
-    build_report(data_dir='./output', out_dir='./report')
+    build_report(data_dir='./output', out_dir='./report', data_fmt="parquet")
@@ -0,0 +1,39 @@
+import os
+import tempfile
+import unittest
+
+from utils import read_table, apply_delta
+
+
+def write_csv(directory: str, name: str, text: str):
+    """
+    Writes a small CSV fixture and returns its path
+    """
+    path = os.path.join(directory, name)
+    with open(path, "w") as f:
+        f.write(text)
+    return path
+
+
+class ApplyDeltaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def read(self, name: str, text: str):
+        return read_table(write_csv(self.tmp.name, name, text))
+
+    def test_numeric_new_column_gets_unknown_placeholder(self):
+        base = self.read("agents.csv", "agent_id,full_name\nAGT001,Sarah Johnson\nAGT002,Michael Chen\n")
+        delta = self.read("agents_delta.csv", "agent_id,full_name,tenure_years,action\nAGT003,Lisa Anderson,3,add\n")
+
+        out = apply_delta(base, delta, "agent_id").set_index("agent_id")
+
+        self.assertEqual(out.loc["AGT001", "tenure_years"], "Unknown")
+        self.assertEqual(out.loc["AGT002", "tenure_years"], "Unknown")
+        self.assertEqual(out.loc["AGT003", "tenure_years"], "3")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,21 @@
+import csv
 import os
+import re
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
 
 DEFAULT_ACTIONS = {"add", "update", "delete"}
 
+# Chunk size the multi-threaded CSV parser splits each file into
+CSV_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Trailing "_YYYYMM" before the file extension
+_MONTH_RE = re.compile(r"_(\d{6})(?:\.[^./\\]+)?$")
+
 
 def make_output_dir(path: str):
     """
@@ -13,30 +26,66 @@ def make_output_dir(path: str):
 
 def get_month_from_filename(path: str):
     """
-    Extracting YYYYMM from filename
+    Extracting YYYYMM from filename, e.g. "agents_delta_202502.csv" -> "202502"
+    """
+    match = _MONTH_RE.search(path)
+    return match.group(1) if match else None
+
+
+def read_csv_arrow(path: str, schema: dict = None, columns: list = None):
+    """
+    Reads a CSV with the multi-threaded PyArrow parser and returns an Arrow-backed DataFrame. Known column types can be
+    passed in through schema to skip type inference, and columns limits parsing to the columns the caller uses
     """
 
-    fname = os.path.basename(path)                                  # e.g. "agents_202502.csv"
-    base, _ = os.path.splitext(fname)                               # -> ("agents_202502", ".csv")
-    parts = base.split("_")                                         # -> ["agents", "202503"]
-    if parts and parts[-1].isdigit() and len(parts[-1]) == 6:
-        return parts[-1]
-    return None
+    convert_options = pv.ConvertOptions(column_types=schema or {}, include_columns=columns or [],
+                                        strings_can_be_null=True, timestamp_parsers=[pv.ISO8601])
+    parse_options = pv.ParseOptions(delimiter=",")
+    read_options = pv.ReadOptions(block_size=CSV_BLOCK_SIZE)
+
+    table = pv.read_csv(path, read_options=read_options, parse_options=parse_options,
+                        convert_options=convert_options)
+
+    return table.to_pandas(types_mapper=pd.ArrowDtype, use_threads=True)
+
+
+def check_columns(path: str, available, columns: list):
+    """
+    Raises a KeyError naming every requested column that isn't in the file
+    """
+    available = set(available)
+    missing = [col for col in columns if col not in available]
+    if missing:
+        raise KeyError(f"{path} is missing column(s): {missing}")
 
 
-def read_table(path: str):
+def read_table(path: str, schema: dict = None, columns: list = None):
     """
     Reads tables based on file type. Should be .csv for initial and delta. Can be others for final reports, which are
-    used to generate the Output Report
+    used to generate the Output Report. If columns is given, only those columns are loaded, and a KeyError is raised
+    if any of them are missing from the file
     """
 
     filename, ext = os.path.splitext(path)
     if ext == ".csv":
-        return pd.read_csv(path)
+        if columns:
+            with open(path, newline="") as f:
+                check_columns(path, next(csv.reader(f), []), columns)
+        return read_csv_arrow(path, schema=schema, columns=columns)
     elif ext in (".json",):
-        return pd.read_json(path, lines=False)
-    elif ext in ("parquet",):
-        return pd.read_parquet(path)
+        df = pd.read_json(path, lines=False)
+        if columns:
+            check_columns(path, df.columns, columns)
+            df = df[columns]
+        return df
+    elif ext == ".parquet":
+        if columns:
+            check_columns(path, pq.read_schema(path).names, columns)
+
+        # self_destruct frees each Arrow column as soon as it's converted, split_blocks skips consolidating them into
+        # 2D blocks, so the conversion doesn't hold two copies of the table at once
+        table = pq.read_table(path, columns=columns, memory_map=True)
+        return table.to_pandas(self_destruct=True, split_blocks=True, types_mapper=pd.ArrowDtype)
     else:
         raise ValueError(f"Unsupported format: {ext}")
 
@@ -47,60 +96,192 @@ def write_table(df: pd.DataFrame, path: str, fmt: str = "csv"):
     """
 
     if fmt == "csv":
-        df.to_csv(path, index=False)
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            pv.write_csv(table, path, write_options=pv.WriteOptions(include_header=True))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            # Arrow can't represent every pandas column (e.g. mixed-type objects), let pandas format those tables
+            df.to_csv(path, index=False)
     elif fmt == "json":
-        df.to_json(path, orient="records", indent=2)
+        # to_json can't serialize Arrow date columns (e.g. hire_date), write them as ISO strings instead
+        date_cols = {
+            col: "string" for col, dtype in df.dtypes.items()
+            if isinstance(dtype, pd.ArrowDtype) and pa.types.is_date(dtype.pyarrow_dtype)
+        }
+        df.astype(date_cols).to_json(path, orient="records", indent=2)
     elif fmt == "parquet":
-        df.to_parquet(path, index=False)
+        # dictionary encoding pays off on the repeated center, department and ID strings
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_table(table, path, compression="zstd", use_dictionary=True)
     else:
         raise ValueError(f"Unsupported format: {fmt}")
 
 
+def share_categories(frames: list, id_col: str, extra: tuple = ("Unknown",)):
+    """
+    Casts id_col in every frame to one shared categorical dtype, so lookups between tables compare integer codes
+    instead of strings. Values in extra (e.g. the "Unknown" placeholder) are added to the categories up front
+    """
+    combined = union_categoricals([pd.Categorical(df[id_col].dropna()) for df in frames], ignore_order=True)
+    categories = combined.categories.union(pd.Index(extra, dtype=combined.categories.dtype))
+    dtype = pd.CategoricalDtype(categories)
+
+    for df in frames:
+        df[id_col] = df[id_col].astype(dtype)
+
+
+def validate_id_columns(tables: dict):
+    """
+    Checks that every table has its ID column. Takes {name: (df, id_col)} and raises once, listing every table that is
+    missing its ID column
+    """
+    missing = [
+        f"{name} table is missing the required ID column '{id_col}'"
+        for name, (df, id_col) in tables.items()
+        if id_col not in df.columns
+    ]
+    if missing:
+        raise ValueError("; ".join(missing))
+
+
+def common_dtype(left, right):
+    """
+    Returns a dtype both left and right can be cast to without losing values, e.g. int64 + double -> double or
+    null + int64 -> int64. Falls back to strings for Arrow types that don't unify, and object for everything else
+    """
+    if isinstance(left, pd.ArrowDtype) and isinstance(right, pd.ArrowDtype):
+        try:
+            unified = pa.unify_schemas(
+                [pa.schema([("col", left.pyarrow_dtype)]), pa.schema([("col", right.pyarrow_dtype)])],
+                promote_options="permissive"
+            )
+            return pd.ArrowDtype(unified.field("col").type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return pd.ArrowDtype(pa.string())
+
+    return object
+
+
+def align_dtypes(df: pd.DataFrame, reference: pd.DataFrame):
+    """
+    Lines the columns df shares with reference up on one dtype, so rows from df can be written into reference. Columns
+    are cast to the reference dtype where that's lossless, otherwise both sides are promoted to a common dtype
+    """
+    for col in df.columns.intersection(reference.columns):
+        target = reference[col].dtype
+        if df[col].dtype == target:
+            continue
+
+        # an all-empty base column (Arrow null) can't hold any value, it always has to be promoted
+        is_null = isinstance(target, pd.ArrowDtype) and pa.types.is_null(target.pyarrow_dtype)
+
+        if not is_null:
+            try:
+                df[col] = df[col].astype(target)
+                continue
+            except (TypeError, ValueError, NotImplementedError):
+                pass
+
+        dtype = common_dtype(target, df[col].dtype)
+        reference[col] = reference[col].astype(dtype)
+        df[col] = df[col].astype(dtype)
+
+    return df, reference
+
+
 def apply_delta(base_df: pd.DataFrame, delta_df: pd.DataFrame, id_col: str):
     """
-    Applies the delta functions (add, update, delete) to the initial file
+    Applies the delta functions (add, update, delete) to the initial file. An update or add for an existing ID replaces
+    the whole record: base columns the delta doesn't carry are cleared. If an ID is repeated in the base table, every
+    copy is dropped and the delta row is appended once
     """
 
     # Delta file missing action column
     if "action" not in delta_df.columns:
         raise ValueError("Delta file must include an 'action' column")
 
-    delta = delta_df.copy()
+    # The base table's ID column is validated once when it's loaded, only the delta needs checking per call
+    validate_id_columns({"delta": (delta_df, id_col)})
 
-    # Normalize actions to all lower-case and no-spaces
-    delta["action"] = delta["action"].astype(str).str.lower().str.strip()
+    # Normalize actions to all lower-case and no-spaces, without touching the caller's frame. Only the distinct raw
+    # values are cleaned up in Python, the rows are remapped through their factorized codes
+    raw_codes, raw_actions = pd.factorize(delta_df["action"])
+    codes, actions = pd.factorize(
+        pd.Index([None if pd.isna(a) else str(a).strip().lower() for a in raw_actions], dtype=object)
+    )
+    action = pd.Series(
+        # a trailing -1 sends the missing-action code (-1) to the missing category
+        pd.Categorical.from_codes(np.append(codes, -1)[raw_codes], categories=actions),
+        index=delta_df.index
+    )
 
-    # Covering for invalid/unknown actions present in the delta file
-    invalid_actions = set(delta['action'].unique()) - DEFAULT_ACTIONS
+    # Covering for invalid/unknown actions present in the delta file, only the distinct actions need checking
+    invalid_actions = set(actions) - DEFAULT_ACTIONS
+    if action.isna().any():
+        invalid_actions.add(None)
     if invalid_actions:
         raise ValueError(f"Invalid action(s) found: {invalid_actions}")
 
-    # Split by action
-    adds = delta[delta["action"] == "add"].drop(columns=["action"])
-    updates = delta[delta["action"] == "update"].drop(columns=["action"])
-    deletes = delta[delta["action"] == "delete"][id_col].unique().tolist()
+    # Index both sides by ID once, so every action below is a hash lookup on the index instead of a column scan
+    out = base_df.set_index(id_col)
+    delta = delta_df.drop(columns=["action"]).set_index(id_col)
 
-    out = base_df.copy()
+    # Split by action, partitioning the rows in a single pass
+    positions = delta_df.groupby(action, sort=False, observed=True).indices
+    groups = {name: delta.iloc[rows] for name, rows in positions.items()}
 
-    # Delete
-    if deletes:
-        out = out[~out[id_col].isin(deletes)]
+    # All three actions probe the base ID index, whose hashtable is built once and cached on the Index
+    index = out.index
+    delete_ids = groups["delete"].index.unique() if "delete" in groups else index[:0]
 
-    # Update
-    if not updates.empty:
-        # drop rows being updated, append new data
-        rows_not_updated = out[~out[id_col].isin(updates[id_col])]
-        out = pd.concat([rows_not_updated, updates], ignore_index=True).fillna('Unknown')
+    # Update and add are both upserts: existing IDs are overwritten in place, new IDs are appended. Adds come after
+    # updates so they win if one delta file touches the same ID twice
+    upserts = [groups[action] for action in ("update", "add") if action in groups]
+    upserts = pd.concat(upserts) if upserts else delta.iloc[:0]
+    upserts = upserts[~upserts.index.duplicated(keep="last")]
 
-    # Add
-    if not adds.empty:
-        # treat as update if ID exists
-        rows_not_added = out[~out[id_col].isin(adds[id_col])]
-        out = pd.concat([rows_not_added, adds], ignore_index=True).fillna('Unknown')
+    # Delta files are typed on their own, so line shared columns up with the base table before writing them in
+    upserts, out = align_dtypes(upserts, out)
 
-    out = out.reset_index(drop=True)
+    new_cols = [col for col in upserts.columns if col not in out.columns] if len(upserts) else []
 
-    return out
+    if index.is_unique:
+        in_base = index.get_indexer(upserts.index) >= 0
+        repeated = np.zeros(len(upserts), dtype=bool)
+    else:
+        in_base = upserts.index.isin(index)
+        repeated = upserts.index.isin(index[index.duplicated()])
 
+    # IDs deleted in this same delta, or repeated in the base table, are dropped and re-added at the end, same as a
+    # brand-new ID
+    existing = in_base & ~upserts.index.isin(delete_ids) & ~repeated
+    drop_ids = delete_ids.union(upserts.index[repeated])
 
+    # Update, replacing the whole record: base columns the delta doesn't carry are cleared
+    if existing.any():
+        update_ids = upserts.index[existing]
+        cleared = [col for col in out.columns if col not in upserts.columns]
+
+        out.loc[update_ids, upserts.columns] = upserts[existing]
+        if cleared:
+            out.loc[update_ids, cleared] = None
+
+    # Delete
+    out = out.drop(drop_ids, errors="ignore")
 
+    # Add
+    if not existing.all():
+        out = pd.concat([out, upserts[~existing]])
+
+    # Only columns introduced by this delta get a placeholder, and only on the rows that predate them. Rows written by
+    # the delta keep their own values, nulls included. The column is widened to text first, since a numeric or date
+    # column can't hold "Unknown"
+    if new_cols:
+        predates = ~out.index.isin(upserts.index)
+        for col in new_cols:
+            text = pd.ArrowDtype(pa.string()) if isinstance(out[col].dtype, pd.ArrowDtype) else object
+            out[col] = out[col].astype(text).where(~predates, "Unknown")
+
+    out = out.reset_index()
+
+    return out